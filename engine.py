@@ -2,8 +2,22 @@
 推論エンジンモジュール
 ベイズ推定と情報エントロピーによる質問選択を実装
 """
-import math
-from typing import Dict, List, Tuple, Optional
+import multiprocessing
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, List, Tuple, Optional, Union
+
+import numpy as np
+from scipy.special import entr
+
+try:
+    from numba import njit, prange, set_num_threads
+    NUMBA_AVAILABLE = True
+except ImportError:
+    # Numbaが無い環境ではNumPyによる実装を使用
+    prange = range
+    NUMBA_AVAILABLE = False
 
 # 尤度計算の定数
 # 回答と期待値の差が最大(2.0)の場合でも最小尤度(0.1)を保証
@@ -11,56 +25,344 @@ from typing import Dict, List, Tuple, Optional
 # 例: diff=0.0 → 1.0 - 0.0*0.45 = 1.0、diff=2.0 → 1.0 - 2.0*0.45 = 0.1
 LIKELIHOOD_SCALING_FACTOR = 0.45
 
+# 属性値の量子化スケール（-1.0〜1.0 を int8 の -126〜126 に対応付ける）
+# 126は偶数のため、0.5刻みの値（±1.0, ±0.5, 0.0）を誤差なく表現できる
+ATTRIBUTE_QUANT_SCALE = 126
+
+# 量子化された差分に対する尤度の係数
+QUANTIZED_LIKELIHOOD_SCALING_FACTOR = LIKELIHOOD_SCALING_FACTOR / ATTRIBUTE_QUANT_SCALE
+
 # わからない（不明）回答の判定閾値
 UNKNOWN_ANSWER_THRESHOLD = 0.01
 
+# 回答として取りうる値（いいえ、たぶんいいえ、わからない、たぶんはい、はい）
+# 尤度テーブルの先頭（いいえ）と末尾（はい）を [::4] で取り出せるよう昇順に並べる
+ANSWER_VALUES = (-1.0, -0.5, 0.0, 0.5, 1.0)
+_ANSWER_INDEX = {value: k for k, value in enumerate(ANSWER_VALUES)}
+
+# 並列計算を使う質問数の下限（これ以下ではプロセス間通信のコストが上回る）
+PARALLEL_QUESTION_THRESHOLD = 10000
+
+# ワーカープロセスの起動方式
+# Numbaのスレッドプールはforkに対して安全ではないため、forkは使わない
+_WORKER_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+# 自然対数（nats）からビットへの変換係数（1/ln2）
+NATS_TO_BITS = 1.4426950408889634
+
+
+def _quantize(value: Union[float, np.ndarray]) -> np.ndarray:
+    """
+    属性値・回答値（-1.0〜1.0）を量子化
+    
+    Args:
+        value: 属性値または回答値
+        
+    Returns:
+        -ATTRIBUTE_QUANT_SCALE〜ATTRIBUTE_QUANT_SCALE に丸めた int16 の値
+    """
+    q = np.rint(np.asarray(value, dtype=np.float64) * ATTRIBUTE_QUANT_SCALE)
+    return np.clip(q, -ATTRIBUTE_QUANT_SCALE, ATTRIBUTE_QUANT_SCALE).astype(np.int16)
+
+
+def _expected_entropy_batch(likelihoods: np.ndarray, probs: np.ndarray, q_indices: np.ndarray) -> np.ndarray:
+    """
+    複数の質問について期待エントロピーを計算するカーネル
+    
+    Args:
+        likelihoods: 「いいえ」「はい」に対する尤度（形状: (2, E, Q)）
+        probs: 現在の事後確率の配列（正規化済み）
+        q_indices: 質問インデックスの配列
+        
+    Returns:
+        質問ごとの期待エントロピーの配列
+        
+    Note:
+        正規化前のスコア s と合計 T から H = ln(T) - Σ s*ln(s) / T として
+        エントロピーを求め、中間配列を作らずに1パスで計算します。
+    """
+    n_entities = probs.shape[0]
+    # すべて0の場合に使う一様分布のエントロピー（ループの外で1度だけ計算）
+    uniform_entropy = np.log(n_entities) * NATS_TO_BITS if n_entities > 0 else 0.0
+    
+    result = np.zeros(q_indices.shape[0])
+    for k in prange(q_indices.shape[0]):
+        q = q_indices[k]
+        total_yes = 0.0
+        total_no = 0.0
+        slog_yes = 0.0
+        slog_no = 0.0
+        for i in range(n_entities):
+            p = probs[i]
+            s_no = p * likelihoods[0, i, q]
+            s_yes = p * likelihoods[1, i, q]
+            total_yes += s_yes
+            total_no += s_no
+            if s_yes > 0:
+                slog_yes += s_yes * np.log(s_yes)
+            if s_no > 0:
+                slog_no += s_no * np.log(s_no)
+        
+        expected_entropy = 0.0
+        for total, slog in ((total_yes, slog_yes), (total_no, slog_no)):
+            if total > 0:
+                entropy = (np.log(total) - slog / total) * NATS_TO_BITS
+            else:
+                entropy = uniform_entropy
+            # probsは正規化済みのため、正規化前の合計がそのままこの回答になる確率
+            expected_entropy += total * entropy
+        result[k] = expected_entropy
+    return result
+
+
+def _expected_entropy_numpy(likelihoods: np.ndarray, probs: np.ndarray, q_indices: np.ndarray,
+                            scratch: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    複数の質問について期待エントロピーをNumPyのブロードキャストで計算
+    
+    Args:
+        likelihoods: 「いいえ」「はい」に対する尤度（形状: (2, E, Q)）
+        probs: 現在の事後確率の配列（正規化済み）
+        q_indices: 質問インデックスの配列
+        scratch: 全質問分の作業用バッファ（形状: (2, E, Q)）、省略時は都度確保
+        
+    Returns:
+        質問ごとの期待エントロピーの配列
+        
+    Note:
+        scratchを渡した場合は、尤度から対象の質問を取り出す際の (2, E, Q) の
+        コピーを避けるため、全質問について計算してから対象の質問の結果を返します。
+        質問の大半を対象とする質問選択で使うことを想定しています。
+    """
+    n_entities = probs.shape[0]
+    if scratch is None:
+        likelihoods = likelihoods[:, :, q_indices]
+        buf = np.empty(likelihoods.shape)
+    else:
+        buf = scratch
+    
+    # 「いいえ」と「はい」の両方の場合をシミュレートし、
+    # 各回答になる確率を計算（正規化前のスコア合計、形状: (2, Q)）
+    np.multiply(probs[None, :, None], likelihoods, out=buf)
+    total_scores = buf.sum(axis=1)
+    
+    # 正規化せずにスコアから直接エントロピーを計算: H = ln(T) - Σ s*ln(s) / T
+    # entrは -s*ln(s) を返すため、合計はそのまま -Σ s*ln(s) になる
+    valid = total_scores > 0
+    neg_slog = entr(buf, out=buf).sum(axis=1)
+    safe_totals = np.where(valid, total_scores, 1.0)
+    entropies = (np.log(safe_totals) + neg_slog / safe_totals) * NATS_TO_BITS
+    # すべて0の場合は一様分布のエントロピー
+    if n_entities:
+        entropies[~valid] = np.log(n_entities) * NATS_TO_BITS
+    
+    # probsは正規化済みのため、正規化前の合計がそのままこの回答になる確率
+    expected_entropies = (total_scores * entropies).sum(axis=0)
+    if scratch is not None:
+        return expected_entropies[q_indices]
+    return expected_entropies
+
+
+if NUMBA_AVAILABLE:
+    _expected_entropy_batch = njit(parallel=True, fastmath=True, cache=True)(_expected_entropy_batch)
+    _expected_entropy = _expected_entropy_batch
+else:
+    _expected_entropy = _expected_entropy_numpy
+
+
+# ワーカープロセスが共有メモリから参照する配列
+_worker_state: Dict[str, Any] = {}
+
+
+def _init_worker(lik_name: str, lik_shape: Tuple[int, ...], probs_name: str, n_entities: int) -> None:
+    """
+    ワーカープロセスの初期化（共有メモリ上の尤度と事後確率に接続）
+    
+    Args:
+        lik_name: 尤度（形状: (2, E, Q)）の共有メモリ名
+        lik_shape: 尤度配列の形状
+        probs_name: 事後確率の共有メモリ名
+        n_entities: エンティティ数
+    """
+    if NUMBA_AVAILABLE:
+        # プロセス単位で並列化するため、カーネル内のスレッド並列は使わない
+        set_num_threads(1)
+    lik_shm = SharedMemory(name=lik_name)
+    probs_shm = SharedMemory(name=probs_name)
+    _worker_state['shm'] = (lik_shm, probs_shm)
+    _worker_state['likelihoods'] = np.ndarray(lik_shape, dtype=np.float32, buffer=lik_shm.buf)
+    _worker_state['probs'] = np.ndarray((n_entities,), dtype=np.float64, buffer=probs_shm.buf)
+
+
+def _worker_expected_entropy(q_indices: np.ndarray) -> np.ndarray:
+    """ワーカープロセスで担当分の質問の期待エントロピーを計算"""
+    return _expected_entropy(_worker_state['likelihoods'], _worker_state['probs'], q_indices)
+
+
+def _shutdown_workers(executor: ProcessPoolExecutor, shms: Tuple[SharedMemory, ...]) -> None:
+    """ワーカープロセスを終了し、共有メモリを解放"""
+    executor.shutdown(wait=True)
+    for shm in shms:
+        shm.close()
+        shm.unlink()
+
 
 class InferenceEngine:
     """ベイズ推定による推論エンジン"""
     
-    def __init__(self, entities: Dict[str, Dict[str, float]], questions: Dict[str, str]):
+    def __init__(self, entities: Dict[str, Dict[str, float]], questions: Dict[str, str], n_workers: int = 1):
         """
         推論エンジンを初期化
         
         Args:
             entities: エンティティと属性値のマッピング
             questions: 質問IDと質問文のマッピング
+            n_workers: 質問選択に使うワーカープロセス数（2以上で、質問数が
+                PARALLEL_QUESTION_THRESHOLDを超える場合に並列計算を行う）
         """
         self.entities = entities
         self.questions = questions
+        # エンティティ名・質問IDと行列インデックスの対応
+        self.entity_names: List[str] = list(entities)
+        self.question_ids: List[str] = list(questions)
+        self.entity_idx: Dict[str, int] = {name: i for i, name in enumerate(self.entity_names)}
+        self.question_idx: Dict[str, int] = {qid: j for j, qid in enumerate(self.question_ids)}
+        # 量子化した属性値行列（エンティティ×質問、int8）と定義済みかどうかのマスク
+        shape = (len(self.entity_names), len(self.question_ids))
+        self.attr_q = np.zeros(shape, dtype=np.int8)
+        self.defined_mask = np.zeros(shape, dtype=bool)
+        for i, entity_name in enumerate(self.entity_names):
+            for question_id, value in entities[entity_name].items():
+                j = self.question_idx.get(question_id)
+                if j is not None:
+                    self.attr_q[i, j] = _quantize(value)
+                    self.defined_mask[i, j] = True
+        # 回答値ごとの尤度とその対数を事前計算（形状: (5, E, Q)）
+        self.lik_table = self._build_likelihood_table(slice(None))
+        self.loglik_table = np.log(self.lik_table)
         # 各エンティティの事後確率を初期化（一様分布）
-        self.probabilities: Dict[str, float] = {}
+        # 正規化前の対数確率で保持し、参照時にのみ正規化する
+        self.logp = np.zeros(len(self.entity_names), dtype=np.float64)
+        self._probs_cache: Optional[np.ndarray] = None
         self._initialize_probabilities()
+        # NumPyによる期待エントロピー計算の作業用バッファ（質問ごとに再確保しない）
+        self._scratch: Optional[np.ndarray] = None
+        if not NUMBA_AVAILABLE:
+            self._scratch = np.empty((2, len(self.entity_names), len(self.question_ids)))
         # 既に質問した質問IDのセット
         self.asked_questions: set = set()
+        # 並列計算用のワーカープロセスと共有メモリ上の配列
+        self.n_workers = n_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._shared_lik: Optional[np.ndarray] = None
+        self._shared_probs: Optional[np.ndarray] = None
+        self._finalizer: Optional[weakref.finalize] = None
+        if n_workers > 1 and len(self.question_ids) > PARALLEL_QUESTION_THRESHOLD:
+            self._start_workers()
+    
+    def _start_workers(self) -> None:
+        """ワーカープロセスを起動し、尤度と事後確率を共有メモリに配置"""
+        likelihoods = self.lik_table[::4]
+        probs = self.probs
+        lik_shm = SharedMemory(create=True, size=max(likelihoods.nbytes, 1))
+        probs_shm = SharedMemory(create=True, size=max(probs.nbytes, 1))
+        self._shared_lik = np.ndarray(likelihoods.shape, dtype=np.float32, buffer=lik_shm.buf)
+        self._shared_lik[...] = likelihoods
+        self._shared_probs = np.ndarray(probs.shape, dtype=np.float64, buffer=probs_shm.buf)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.n_workers,
+            mp_context=multiprocessing.get_context(_WORKER_START_METHOD),
+            initializer=_init_worker,
+            initargs=(lik_shm.name, likelihoods.shape, probs_shm.name, len(probs))
+        )
+        # エンジンが破棄された場合もワーカーと共有メモリを確実に解放する
+        self._finalizer = weakref.finalize(self, _shutdown_workers, self._executor, (lik_shm, probs_shm))
+    
+    def close(self) -> None:
+        """ワーカープロセスと共有メモリを解放"""
+        if self._finalizer is None:
+            return
+        # 共有メモリを閉じる前に、バッファを参照する配列を破棄する
+        self._shared_lik = None
+        self._shared_probs = None
+        self._executor = None
+        self._finalizer()
+        self._finalizer = None
+    
+    def _build_likelihood_table(self, columns: slice) -> np.ndarray:
+        """
+        ANSWER_VALUESの各回答値に対する尤度を計算
+        
+        Args:
+            columns: 対象とする質問インデックスのスライス
+            
+        Returns:
+            尤度の配列（形状: (5, E, 対象の質問数)）
+        """
+        answers_q = _quantize(ANSWER_VALUES).reshape(-1, 1, 1)
+        return np.where(
+            self.defined_mask[None, :, columns],
+            self._calculate_likelihood(self.attr_q[None, :, columns], answers_q),
+            np.float32(0.5)
+        )
+    
+    @property
+    def probs(self) -> np.ndarray:
+        """正規化済みの事後確率の配列"""
+        if self._probs_cache is None:
+            if not self.entity_names:
+                self._probs_cache = np.empty(0, dtype=np.float64)
+            else:
+                # 最大値を引いてからexpを取りアンダーフローを防ぐ
+                p = np.exp(self.logp - self.logp.max())
+                p /= p.sum()
+                self._probs_cache = p
+        return self._probs_cache
+    
+    @property
+    def probabilities(self) -> Dict[str, float]:
+        """エンティティ名をキーとした事後確率"""
+        return {name: float(p) for name, p in zip(self.entity_names, self.probs)}
     
     def _initialize_probabilities(self) -> None:
         """事後確率を一様分布で初期化"""
-        if not self.entities:
-            return
-        initial_prob = 1.0 / len(self.entities)
-        for entity_name in self.entities:
-            self.probabilities[entity_name] = initial_prob
+        self.logp.fill(0.0)
+        self._probs_cache = None
     
     def reset(self) -> None:
         """推論状態をリセット"""
         self._initialize_probabilities()
         self.asked_questions.clear()
     
-    def _calculate_likelihood(self, expected_value: float, answer: float) -> float:
+    def _calculate_likelihood(self, expected_q: np.ndarray, answer_q: Union[int, np.ndarray]) -> np.ndarray:
         """
-        回答と期待値から尤度を計算
+        量子化された回答と期待値から尤度を要素ごとに計算
         
         Args:
-            expected_value: エンティティの期待値（-1.0〜1.0）
-            answer: ユーザーの回答値（-1.0〜1.0）
+            expected_q: 量子化されたエンティティの期待値の配列
+            answer_q: 量子化されたユーザーの回答値
             
         Returns:
-            尤度（0.1〜1.0）
+            尤度（0.1〜1.0）の配列
         """
-        diff = abs(expected_value - answer)
+        # int8同士の差はint16で計算すればオーバーフローしない
+        diff = np.abs(expected_q.astype(np.int16) - answer_q)
         # 差が0なら尤度1.0、差が2.0（最大）なら尤度0.1
-        return max(0.1, 1.0 - diff * LIKELIHOOD_SCALING_FACTOR)
+        return np.maximum(np.float32(0.1), np.float32(1.0) - diff * np.float32(QUANTIZED_LIKELIHOOD_SCALING_FACTOR))
+    
+    def _column_likelihoods(self, q_idx: int, answer: float) -> np.ndarray:
+        """
+        1つの質問に対する全エンティティの尤度を計算
+        
+        Args:
+            q_idx: 質問のインデックス
+            answer: 回答値
+            
+        Returns:
+            エンティティごとの尤度の配列（属性が未定義の場合は中立的な0.5）
+        """
+        col = self.attr_q[:, q_idx]
+        return np.where(self.defined_mask[:, q_idx], self._calculate_likelihood(col, _quantize(answer)), 0.5)
     
     def update_probabilities(self, question_id: str, answer: float) -> None:
         """
@@ -76,26 +378,18 @@ class InferenceEngine:
         if abs(answer) < UNKNOWN_ANSWER_THRESHOLD:
             return
         
-        # 各エンティティの尤度を計算
-        likelihoods: Dict[str, float] = {}
-        for entity_name, attributes in self.entities.items():
-            if question_id in attributes:
-                expected_value = attributes[question_id]
-                likelihood = self._calculate_likelihood(expected_value, answer)
-                likelihoods[entity_name] = likelihood
-            else:
-                # 属性が未定義の場合は中立的な尤度
-                likelihoods[entity_name] = 0.5
-        
-        # ベイズ更新: P(entity|answer) ∝ P(answer|entity) * P(entity)
-        for entity_name in self.probabilities:
-            self.probabilities[entity_name] *= likelihoods[entity_name]
+        q_idx = self.question_idx.get(question_id)
+        if q_idx is None or not self.entity_names:
+            return
         
-        # 正規化
-        total = sum(self.probabilities.values())
-        if total > 0:
-            for entity_name in self.probabilities:
-                self.probabilities[entity_name] /= total
+        # ベイズ更新: log P(entity|answer) = log P(answer|entity) + log P(entity) + 定数
+        # 正規化は確率を参照する時点まで遅延する
+        ans_idx = _ANSWER_INDEX.get(answer)
+        if ans_idx is not None:
+            self.logp += self.loglik_table[ans_idx, :, q_idx]
+        else:
+            self.logp += np.log(self._column_likelihoods(q_idx, answer))
+        self._probs_cache = None
     
     def get_best_question(self) -> Optional[str]:
         """
@@ -104,43 +398,34 @@ class InferenceEngine:
         Returns:
             最適な質問ID、または質問がない場合はNone
         """
-        available_questions = [qid for qid in self.questions if qid not in self.asked_questions]
+        available_questions = [qid for qid in self.question_ids if qid not in self.asked_questions]
         
         if not available_questions:
             return None
         
-        best_question = None
-        max_info_gain = -1.0
-        
         # 現在のエントロピーを計算
-        current_entropy = self._calculate_entropy(self.probabilities)
+        current_entropy = self._calculate_entropy(self.probs)
         
-        for question_id in available_questions:
-            # この質問をした場合の期待情報利得を計算
-            expected_entropy = self._calculate_expected_entropy(question_id)
-            info_gain = current_entropy - expected_entropy
-            
-            if info_gain > max_info_gain:
-                max_info_gain = info_gain
-                best_question = question_id
+        # 全候補の質問について期待情報利得を一括で計算
+        q_indices = np.array([self.question_idx[qid] for qid in available_questions], dtype=np.intp)
+        info_gains = current_entropy - self._calculate_expected_entropies(q_indices)
         
-        return best_question
+        return available_questions[int(np.argmax(info_gains))]
     
-    def _calculate_entropy(self, probs: Dict[str, float]) -> float:
+    def _calculate_entropy(self, probs: Union[np.ndarray, Dict[str, float]]) -> float:
         """
         エントロピーを計算
         
         Args:
-            probs: 確率分布
+            probs: 確率分布の配列（エンティティ名をキーとした辞書も可）
             
         Returns:
-            エントロピー値
+            エントロピー値（ビット）
         """
-        entropy = 0.0
-        for prob in probs.values():
-            if prob > 0:
-                entropy -= prob * math.log2(prob)
-        return entropy
+        if isinstance(probs, dict):
+            probs = np.fromiter(probs.values(), dtype=np.float64, count=len(probs))
+        # entrは -x*ln(x) を要素ごとに計算し、x=0 では0を返す
+        return float(entr(probs).sum() * NATS_TO_BITS)
     
     def _calculate_expected_entropy(self, question_id: str) -> float:
         """
@@ -157,44 +442,44 @@ class InferenceEngine:
             回答のみをシミュレートします。実際には「たぶんはい(0.5)」などの
             中間的な回答も可能ですが、情報利得の傾向を把握するには十分です。
         """
-        # 「はい」と「いいえ」の両方の場合をシミュレート
-        expected_entropy = 0.0
+        q_idx = self.question_idx[question_id]
+        return float(self._calculate_expected_entropies(np.array([q_idx], dtype=np.intp))[0])
+    
+    def _calculate_expected_entropies(self, q_indices: np.ndarray) -> np.ndarray:
+        """
+        複数の質問について期待エントロピーを一括で計算
         
-        for answer in [1.0, -1.0]:
-            # この回答になる確率を計算（正規化前のスコア合計）
-            total_score = 0.0
-            temp_scores = {}
-            
-            for entity_name in self.entities:
-                if question_id in self.entities[entity_name]:
-                    expected_value = self.entities[entity_name][question_id]
-                    likelihood = self._calculate_likelihood(expected_value, answer)
-                else:
-                    likelihood = 0.5
-                
-                score = self.probabilities[entity_name] * likelihood
-                temp_scores[entity_name] = score
-                total_score += score
-            
-            # 正規化して確率分布を作成
-            temp_probs = {}
-            if total_score > 0:
-                for entity_name in temp_scores:
-                    temp_probs[entity_name] = temp_scores[entity_name] / total_score
-            else:
-                # すべて0の場合は一様分布
-                uniform_prob = 1.0 / len(self.entities) if self.entities else 0.0
-                for entity_name in self.entities:
-                    temp_probs[entity_name] = uniform_prob
-            
-            # この回答になる確率（正規化前の合計 / 現在の確率の合計）
-            current_total = sum(self.probabilities.values())
-            answer_prob = total_score / current_total if current_total > 0 else 0.5
+        Args:
+            q_indices: 質問インデックスの配列
             
-            # このシナリオのエントロピーを加算
-            expected_entropy += answer_prob * self._calculate_entropy(temp_probs)
+        Returns:
+            質問ごとの期待エントロピーの配列
+        """
+        probs = self.probs
+        assert not len(probs) or abs(probs.sum() - 1.0) < 1e-9
         
-        return expected_entropy
+        if self._executor is not None and len(q_indices) > PARALLEL_QUESTION_THRESHOLD:
+            return self._calculate_expected_entropies_parallel(probs, q_indices)
+        if NUMBA_AVAILABLE:
+            return _expected_entropy_batch(self.lik_table[::4], probs, q_indices)
+        # 対象が一部の質問だけなら、全質問を計算するより取り出した方が安い
+        scratch = self._scratch if 2 * len(q_indices) >= len(self.question_ids) else None
+        return _expected_entropy_numpy(self.lik_table[::4], probs, q_indices, scratch)
+    
+    def _calculate_expected_entropies_parallel(self, probs: np.ndarray, q_indices: np.ndarray) -> np.ndarray:
+        """
+        質問をワーカープロセスに分割して期待エントロピーを計算
+        
+        Args:
+            probs: 現在の事後確率の配列（正規化済み）
+            q_indices: 質問インデックスの配列
+            
+        Returns:
+            質問ごとの期待エントロピーの配列
+        """
+        self._shared_probs[...] = probs
+        chunks = np.array_split(q_indices, self.n_workers)
+        return np.concatenate(list(self._executor.map(_worker_expected_entropy, chunks)))
     
     def get_top_candidates(self, n: int = 3) -> List[Tuple[str, float]]:
         """
@@ -206,12 +491,17 @@ class InferenceEngine:
         Returns:
             (エンティティ名, 確率)のリスト
         """
-        sorted_entities = sorted(
-            self.probabilities.items(),
-            key=lambda x: x[1],
-            reverse=True
-        )
-        return sorted_entities[:n]
+        probs = self.probs
+        n = min(n, len(probs))
+        if n <= 0:
+            return []
+        
+        # 上位N件の境界となる確率を部分ソートで求め、それ以上の候補だけを並べる
+        # 境界で同率の候補も含めることで、同率の場合は元の順序（インデックスの小さい順）を保つ
+        threshold = probs[np.argpartition(probs, -n)[-n:]].min()
+        idx = np.flatnonzero(probs >= threshold)
+        idx = idx[np.lexsort((idx, -probs[idx]))][:n]
+        return [(self.entity_names[i], float(probs[i])) for i in idx]
     
     def get_best_guess(self) -> Optional[Tuple[str, float]]:
         """
@@ -220,11 +510,11 @@ class InferenceEngine:
         Returns:
             (エンティティ名, 確率)、またはNone
         """
-        if not self.probabilities:
+        if not self.entity_names:
             return None
         
-        best_entity = max(self.probabilities.items(), key=lambda x: x[1])
-        return best_entity
+        i = int(np.argmax(self.probs))
+        return self.entity_names[i], float(self.probs[i])
     
     def reinforce_entity(self, entity_name: str, question_id: str, answer: float, learning_rate: float = 0.1) -> None:
         """
@@ -240,10 +530,24 @@ class InferenceEngine:
             return
         
         if question_id not in self.entities[entity_name]:
-            self.entities[entity_name][question_id] = answer
+            new_value = answer
         else:
             # 既存の値を回答に近づける
             current_value = self.entities[entity_name][question_id]
             new_value = current_value + learning_rate * (answer - current_value)
             # -1.0から1.0の範囲に制限
-            self.entities[entity_name][question_id] = max(-1.0, min(1.0, new_value))
+            new_value = float(np.clip(new_value, -1.0, 1.0))
+        self.entities[entity_name][question_id] = new_value
+        
+        # 属性値行列にも反映
+        i = self.entity_idx.get(entity_name)
+        j = self.question_idx.get(question_id)
+        if i is not None and j is not None:
+            self.attr_q[i, j] = _quantize(new_value)
+            self.defined_mask[i, j] = True
+            # 変更された質問の尤度のみ再計算
+            column = slice(j, j + 1)
+            self.lik_table[:, :, column] = self._build_likelihood_table(column)
+            self.loglik_table[:, :, column] = np.log(self.lik_table[:, :, column])
+            if self._shared_lik is not None:
+                self._shared_lik[:, :, column] = self.lik_table[::4, :, column]
@@ -1,10 +1,21 @@
 """
 知識ベースの管理モジュール
 JSONファイルからの読み込み・保存機能を提供
+（大きな知識ベース向けにNumPyのnpz形式での読み込み・保存も提供）
 """
 import json
+import mmap
 import os
-from typing import Dict, List, Any
+import zipfile
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    # orjsonが無い環境では標準ライブラリのjsonを使用
+    orjson = None
 
 
 class KnowledgeBase:
@@ -20,6 +31,8 @@ class KnowledgeBase:
         self.filepath = filepath
         self.entities: Dict[str, Dict[str, Any]] = {}
         self.questions: Dict[str, str] = {}
+        # 最後に保存してから変更があったかどうか
+        self._dirty = False
         self.load()
     
     def load(self) -> None:
@@ -30,27 +43,159 @@ class KnowledgeBase:
             return
         
         try:
-            with open(self.filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            with open(self.filepath, 'rb') as f:
+                data = self._parse(f)
                 self.entities = data.get('entities', {})
                 self.questions = data.get('questions', {})
+                self._dirty = False
         except (json.JSONDecodeError, IOError) as e:
             print(f"警告: データの読み込みに失敗しました: {e}")
             self._initialize_default_data()
     
     def save(self) -> None:
-        """知識ベースをJSONファイルに保存"""
+        """
+        知識ベースをJSONファイルに保存
+        
+        前回の保存から変更がない場合は何もしません。一時ファイルに書き込んでから
+        置き換えるため、保存中に異常終了してもファイルが壊れることはありません。
+        """
+        if not self._dirty:
+            return
+        
         data = {
             'entities': self.entities,
             'questions': self.questions
         }
+        tmp_path = self.filepath + '.tmp'
+        
+        try:
+            with open(tmp_path, 'wb') as f:
+                if orjson is not None:
+                    f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+                else:
+                    f.write(json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8'))
+                # 置き換え前にディスクへ書き出し、電源断でも中身の無いファイルが残らないようにする
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.filepath)
+            self._dirty = False
+        except IOError as e:
+            print(f"エラー: データの保存に失敗しました: {e}")
+        finally:
+            # 書き込みや置き換えに失敗した場合は一時ファイルを残さない
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    def mark_dirty(self) -> None:
+        """
+        知識ベースが外部で変更されたことを記録
+        
+        推論エンジンの強化学習のように、エンティティの属性を直接書き換えた場合に
+        呼び出すと、次回のsave()で保存されます。
+        """
+        self._dirty = True
+    
+    @staticmethod
+    def _parse(f) -> Dict[str, Any]:
+        """
+        バイナリモードで開いたJSONファイルを解析
+        
+        Args:
+            f: バイナリモードで開いたファイルオブジェクト
+            
+        Returns:
+            解析結果の辞書
+        """
+        if orjson is None:
+            return json.loads(f.read().decode('utf-8'))
+        
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # 空ファイルはmmapできないため、そのままorjsonに解析エラーを出させる
+            return orjson.loads(b'')
+        # mmapしたファイルをコピーせずにorjsonへ渡す
+        with buf, memoryview(buf) as view:
+            return orjson.loads(view)
+    
+    def _npz_path(self, filepath: Optional[str]) -> str:
+        """npzファイルのパスを決定（未指定ならJSONファイルと同名の.npz）"""
+        if filepath is not None:
+            return filepath
+        return os.path.splitext(self.filepath)[0] + '.npz'
+    
+    def save_npz(self, filepath: Optional[str] = None) -> None:
+        """
+        知識ベースを列指向のバイナリ形式（npz）で保存
+        
+        属性値は float32 の行列、定義済みかどうかは bool のマスクとして保存し、
+        エンティティ名・質問ID・質問文は文字列配列として保存します。
+        load()/save() はJSONのみを扱うため、npz形式が必要な場合に明示的に呼び出します。
+        
+        Args:
+            filepath: 保存先のパス（省略時はJSONファイルと同名の.npz）
+        """
+        entity_names = list(self.entities)
+        # 質問一覧にない属性キーも失わないよう列に含める
+        columns = list(self.questions)
+        column_idx = {qid: j for j, qid in enumerate(columns)}
+        for attributes in self.entities.values():
+            for qid in attributes:
+                if qid not in column_idx:
+                    column_idx[qid] = len(columns)
+                    columns.append(qid)
+        
+        attr = np.zeros((len(entity_names), len(columns)), dtype=np.float32)
+        mask = np.zeros(attr.shape, dtype=bool)
+        for i, entity_name in enumerate(entity_names):
+            for qid, value in self.entities[entity_name].items():
+                j = column_idx[qid]
+                attr[i, j] = value
+                mask[i, j] = True
         
         try:
-            with open(self.filepath, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            with open(self._npz_path(filepath), 'wb') as f:
+                np.savez(
+                    f,
+                    attr=attr,
+                    mask=mask,
+                    entities=np.array(entity_names, dtype=str),
+                    columns=np.array(columns, dtype=str),
+                    questions_keys=np.array(list(self.questions), dtype=str),
+                    questions_text=np.array(list(self.questions.values()), dtype=str)
+                )
         except IOError as e:
             print(f"エラー: データの保存に失敗しました: {e}")
     
+    def load_npz(self, filepath: Optional[str] = None) -> None:
+        """
+        npz形式で保存された知識ベースを読み込む
+        
+        Args:
+            filepath: 読み込むパス（省略時はJSONファイルと同名の.npz）
+        """
+        try:
+            with np.load(self._npz_path(filepath), allow_pickle=False) as data:
+                attr = data['attr']
+                mask = data['mask']
+                entity_names = data['entities'].tolist()
+                columns = data['columns'].tolist()
+                questions = dict(zip(data['questions_keys'].tolist(), data['questions_text'].tolist()))
+        except (KeyError, ValueError, EOFError, zipfile.BadZipFile, IOError) as e:
+            print(f"警告: データの読み込みに失敗しました: {e}")
+            return
+        
+        # float32で保存した値を小数点以下6桁に丸めてJSONでの表記を保つ
+        values = np.round(attr.astype(np.float64), 6)
+        self.entities = {
+            entity_name: {
+                columns[j]: float(values[i, j]) for j in np.flatnonzero(mask[i])
+            }
+            for i, entity_name in enumerate(entity_names)
+        }
+        self.questions = questions
+        self._dirty = True
+    
     def add_entity(self, entity_name: str, attributes: Dict[str, float]) -> None:
         """
         新しいエンティティを追加
@@ -60,6 +205,7 @@ class KnowledgeBase:
             attributes: 質問IDと属性値(-1.0〜1.0)のマッピング
         """
         self.entities[entity_name] = attributes
+        self._dirty = True
     
     def update_attribute(self, entity_name: str, question_id: str, value: float) -> None:
         """
@@ -72,6 +218,7 @@ class KnowledgeBase:
         """
         if entity_name in self.entities:
             self.entities[entity_name][question_id] = value
+            self._dirty = True
     
     def add_question(self, question_id: str, question_text: str) -> None:
         """
@@ -82,6 +229,7 @@ class KnowledgeBase:
             question_text: 質問文
         """
         self.questions[question_id] = question_text
+        self._dirty = True
     
     def get_all_entities(self) -> Dict[str, Dict[str, float]]:
         """全エンティティを取得"""
@@ -93,6 +241,7 @@ class KnowledgeBase:
     
     def _initialize_default_data(self) -> None:
         """デフォルトの初期データで初期化"""
+        self._dirty = True
         # 質問IDと質問文
         self.questions = {
             'q1': 'それは哺乳類ですか？',
@@ -7,6 +7,16 @@ from engine import InferenceEngine, UNKNOWN_ANSWER_THRESHOLD
 import uuid
 
 
+# ユーザーの選択肢と回答値の対応
+ANSWER_MAPPING = {
+    '1': 1.0,    # はい
+    '2': 0.5,    # たぶんはい
+    '3': 0.0,    # わからない
+    '4': -0.5,   # たぶんいいえ
+    '5': -1.0    # いいえ
+}
+
+
 def get_answer_value(choice: str) -> float:
     """
     ユーザーの選択肢を数値に変換
@@ -17,14 +27,7 @@ def get_answer_value(choice: str) -> float:
     Returns:
         数値化された回答
     """
-    mapping = {
-        '1': 1.0,    # はい
-        '2': 0.5,    # たぶんはい
-        '3': 0.0,    # わからない
-        '4': -0.5,   # たぶんいいえ
-        '5': -1.0    # いいえ
-    }
-    return mapping.get(choice, 0.0)
+    return ANSWER_MAPPING.get(choice, 0.0)
 
 
 def display_question(question_text: str) -> str:
@@ -46,7 +49,7 @@ def display_question(question_text: str) -> str:
     
     while True:
         choice = input("選択してください (1-5): ").strip()
-        if choice in ['1', '2', '3', '4', '5']:
+        if choice in ANSWER_MAPPING:
             return choice
         print("無効な選択です。1から5の数字を入力してください。")
 
@@ -94,6 +97,7 @@ def play_game(kb: KnowledgeBase, engine: InferenceEngine) -> bool:
                 # 強化学習：回答に基づいて属性を更新
                 for question_id, answer_value in answer_history.items():
                     engine.reinforce_entity(entity_name, question_id, answer_value)
+                kb.mark_dirty()
                 
                 kb.save()
                 print("学習結果を保存しました。")
@@ -141,6 +145,7 @@ def play_game(kb: KnowledgeBase, engine: InferenceEngine) -> bool:
             # 強化学習：回答に基づいて属性を更新
             for question_id, answer_value in answer_history.items():
                 engine.reinforce_entity(entity_name, question_id, answer_value)
+            kb.mark_dirty()
             
             kb.save()
             return ask_play_again()